@@ -1,12 +1,20 @@
 import unittest
 import threading
+import subprocess
+import tempfile
+import json
+import http.server
 import matplotlib.pyplot as plt
 import sys
 import os
+import random
+import importlib.util
+import time
 
 sys.path.append(os.path.dirname(os.path.realpath(__file__)) + "/..")
 
-from wdc import DataVisualizer, dco, dbc, Query, AxisSubset
+from wdc import DataVisualizer, dco, dbc, Query, AxisSubset, QueryRecorder, IncrementalStore, ResultCache
+from wdc import replay
 
 class testcases(unittest.TestCase):
     def setUp(self):
@@ -178,6 +186,644 @@ class testcases(unittest.TestCase):
         for thread in threads:
             thread.join()
             
+
+    def test_plan_boxes(self):
+        """
+        Test that nearby points share a request and far away points do not.
+        """
+
+        boxes = dco._plan_boxes([0, 0.5, 10, 1.9], [0, 1, 10, 0.2], 2.0)
+
+        self.assertEqual(boxes, [[0, 1, 3], [2]])
+
+    def test_plan_boxes_many(self):
+        """
+        Test that planning thousands of stations stays fast and keeps every box small.
+        """
+
+        generator = random.Random(1)
+        lats = [generator.uniform(-90, 90) for _ in range(5000)]
+        longs = [generator.uniform(-180, 180) for _ in range(5000)]
+
+        start = time.perf_counter()
+        boxes = dco._plan_boxes(lats, longs, 2.0)
+        self.assertLess(time.perf_counter() - start, 0.5)
+
+        self.assertEqual(sorted(i for box in boxes for i in box), list(range(5000)))
+        for box in boxes:
+            self.assertLessEqual(max(lats[i] for i in box) - min(lats[i] for i in box), 2.0)
+            self.assertLessEqual(max(longs[i] for i in box) - min(longs[i] for i in box), 2.0)
+
+    def test_extract_points(self):
+        """
+        Test extracting the time series of several points with one call.
+        """
+
+        query = Query(["AvgLandTemp"])
+        datacube = dco(self.dbc, query)
+
+        lats = [27.09, 27.09, 43]
+        longs = [64, 67, 57]
+        res = datacube.extract_points(lats, longs, "2003-09", "2009-02")
+
+        # One row per point, one column per month
+        self.assertEqual(res.shape, (3, 66))
+        self.assertAlmostEqual(res[0].min(), 14.409449, places=4)
+        self.assertAlmostEqual(res[1].max(), 45.0, places=4)
+            
+
+    def test_scale(self):
+        """
+        Test that a scaled query wraps the result in the WCPS scale function.
+        """
+
+        query = Query(["AvgLandTemp"])
+        query.set_subset([AxisSubset("ansi", "2014-07"), AxisSubset("Lat", -20, 30)])
+        query.encode(Query.Types.png)
+        query.set_scale(0.25)
+
+        self.assertIn("encode ( scale ( ( $c  [ $subset ] ) , 0.25 ) , \"image/png\" )", str(query))
+
+        query.reset_scale()
+        self.assertNotIn("scale", str(query))
+
+    def test_progressive(self):
+        """
+        Test that a progressive query returns the preview first, then every tile,
+        and that the preview comes from the cache the second time.
+        """
+
+        query = Query(["AvgLandTemp"])
+        query.set_subset([AxisSubset("ansi", "2014-07"), AxisSubset("Lat", -20, 30), AxisSubset("Long", 10, 30)])
+        query.encode(Query.Types.png)
+        datacube = dco(self.dbc, query)
+
+        res = list(datacube.execute_progressive(scales=(0.25,), tiles=2))
+
+        self.assertEqual([scale for scale, subset, data in res], [0.25, 1, 1, 1, 1])
+        self.assertTrue(all(isinstance(data, bytes) for scale, subset, data in res))
+
+        next(datacube.execute_progressive(scales=(0.25,), tiles=2))
+        self.assertEqual(datacube.cache.hits, 1)
+            
+
+    def test_downsample_series(self):
+        """
+        Test that a long series is reduced to the size of the plot but keeps its peaks.
+        """
+
+        values = [0.0] * 100000
+        values[12345] = 50.0
+        values[54321] = -50.0
+
+        x, y = DataVisualizer.downsample_series(values, 800)
+
+        self.assertLessEqual(len(y), 2 * 800 + 2)
+        self.assertEqual(y.max(), 50.0)
+        self.assertEqual(y.min(), -50.0)
+        self.assertIn(12345, x)
+
+    def test_downsample_series_gap(self):
+        """
+        Test that a nodata gap (a run of NaN) is kept as a gap instead of failing,
+        and that series and rasters with gaps can be rendered.
+        """
+
+        values = [float(i % 7) for i in range(5000)]
+        values[1000:1200] = [float("nan")] * 200
+        values[-3:] = [float("nan")] * 3
+
+        x, y = DataVisualizer.downsample_series(values, 100)
+
+        self.assertLessEqual(len(y), 2 * 100 + 2)
+        # One NaN for each of the four buckets in the gap
+        self.assertEqual(sum(1 for value in y if value != value), 4)
+        self.assertEqual(DataVisualizer.Renderer._to_array(",".join(map(str, y))).shape, y.shape)
+
+        images = DataVisualizer.render_batch([values, [[float("nan")] * 3] * 2, [[1, 2], [3, 4]]], max_workers=1)
+        self.assertTrue(all(image.startswith(b"\x89PNG") for image in images))
+
+    def test_render_batch(self):
+        """
+        Test rendering several series and rasters into png buffers off the main thread.
+        """
+
+        results = [list(range(5000)), [[1, 2], [3, 4]], "1,2,3,4"]
+
+        images = DataVisualizer.render_batch(results, max_workers=2)
+
+        self.assertEqual(len(images), 3)
+        self.assertTrue(all(image.startswith(b"\x89PNG") for image in images))
+            
+
+    def test_import_time(self):
+        """
+        Benchmark "import wdc" with python -X importtime and check that it stays
+        within its budget and does not load the heavy dependencies.
+        """
+
+        budget_us = 30000
+        package_dir = os.path.dirname(os.path.realpath(__file__)) + "/.."
+
+        code = "import sys, wdc; wdc.Query; print(sorted(m for m in ('requests', 'numpy', 'PIL', 'pandas', 'matplotlib') if m in sys.modules))"
+        res = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                             cwd=package_dir, capture_output=True, text=True)
+
+        # Lines look like "import time:   self [us] |   cumulative | imported package"
+        cumulative = [int(line.split("|")[1]) for line in res.stderr.splitlines()
+                      if line.startswith("import time:") and line.split("|")[2].strip() == "wdc"]
+
+        self.assertEqual(res.stdout.strip(), "[]")
+        self.assertEqual(len(cumulative), 1)
+        self.assertLess(cumulative[0], budget_us)
+            
+
+    def test_execute_queries_decode(self):
+        """
+        Test sending png queries together and decoding them in a process pool.
+        """
+
+        queries = []
+        for month in ["2014-01", "2014-04", "2014-07"]:
+            query = Query(["AvgLandTemp"])
+            query.set_subset([AxisSubset("ansi", month), AxisSubset("Lat", -20, 30), AxisSubset("Long", 10, 30)])
+            query.encode(Query.Types.png)
+            queries.append(query)
+
+        res = self.dbc.execute_queries(queries, decode=True, processes=2)
+
+        self.assertEqual(len(res), 3)
+        self.assertTrue(all(data.ndim >= 2 for data in res))
+        self.assertEqual(res[0].shape, res[1].shape)
+            
+
+    def test_prefetching(self):
+        """
+        Test that stepping through months is answered from prefetched results.
+        """
+
+        query = Query(["AvgLandTemp"])
+        query.set_aggregation_method(Query.AggregationMethod.max)
+        datacube = dco(self.dbc, query)
+        prefetcher = datacube.enable_prefetching(budget=2, max_workers=2)
+
+        results = []
+        for month in ["2014-01", "2014-02", "2014-03", "2014-04"]:
+            query.set_subset([AxisSubset("ansi", month), AxisSubset("Lat", 27.09), AxisSubset("Long", 67)])
+            results.append(datacube.execute_query())
+
+        datacube.disable_prefetching()
+
+        # Every month after the first one was requested in advance
+        self.assertEqual(prefetcher.statistics()["hits"], 3)
+        for month, res in zip(["2014-01", "2014-02", "2014-03", "2014-04"], results):
+            query.set_subset([AxisSubset("ansi", month), AxisSubset("Lat", 27.09), AxisSubset("Long", 67)])
+            self.assertEqual(res, self.dbc.execute_query(query))
+            
+
+    def test_record_and_replay(self):
+        """
+        Test recording queries and replaying the log against a local stand-in server.
+        """
+
+        queries = ["for $c in (AvgLandTemp) return 1", "for $c in (AvgLandTemp) return 2"]
+
+        log_path = os.path.join(tempfile.mkdtemp(), "queries.log")
+        recorder = QueryRecorder(log_path)
+
+        # Record against a stand-in that answers like the server, with a single byte
+        server = replay.start_stand_in({query: 1 for query in queries})
+        try:
+            connector = dbc(f"http://127.0.0.1:{server.server_port}", recorder=recorder)
+            for query in queries:
+                connector.execute_query(query)
+        finally:
+            server.shutdown()
+            server.server_close()
+            recorder.close()
+
+        records = list(QueryRecorder.read(log_path))
+        self.assertEqual([record["q"] for record in records], queries)
+        self.assertEqual(records[0]["n"], 1)
+
+        report = replay.main([log_path, "--local", "--concurrency", "4", "--repeat", "5"])
+        self.assertEqual(report["requests"], 10)
+        self.assertEqual(report["errors"], 0)
+        self.assertEqual(report["bytes"], 10)
+            
+
+    def test_most_compact(self):
+        """
+        Test that numeric results are sent in binary formats.
+        """
+
+        # netcdf needs the optional netCDF4 package, json does not
+        binary = Query.Types.netcdf if importlib.util.find_spec("netCDF4") != None else Query.Types.json
+
+        self.assertEqual(Query.Types.most_compact(0), None)
+        self.assertEqual(Query.Types.most_compact(1), binary)
+        self.assertEqual(Query.Types.most_compact(2), Query.Types.tiff)
+        self.assertEqual(Query.Types.most_compact(3), binary)
+
+    def test_execute_array_encoding(self):
+        """
+        Test that a time series is requested in an encoding that can be decoded here,
+        against a local server that answers json and netcdf requests only.
+        """
+
+        requested = []
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0))).decode("utf-8")
+                requested.append(body)
+
+                self.send_response(200 if "json" in body or "netcdf" in body else 400)
+                self.end_headers()
+                self.wfile.write(b"[1.5, 2.5, 3.5]")
+
+            def log_message(self, format, *args):
+                pass
+
+        query = Query(["AvgLandTemp"])
+        query.set_subset([AxisSubset("ansi", "2003-09", "2003-11"), AxisSubset("Lat", 27.09), AxisSubset("Long", 64)])
+
+        server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            connector = dbc(f"http://127.0.0.1:{server.server_port}")
+            if importlib.util.find_spec("netCDF4") == None:
+                self.assertEqual(connector.execute_array(query).tolist(), [1.5, 2.5, 3.5])
+            else:
+                self.assertEqual(connector.execute_array(query, encoding=Query.Types.json).tolist(), [1.5, 2.5, 3.5])
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        self.assertEqual(len(requested), 1)
+
+    def test_execute_array(self):
+        """
+        Test getting a time series as an array through a binary encoding,
+        and compare it with the same series sent as CSV.
+        """
+
+        query = Query(["AvgLandTemp"])
+        query.set_subset([AxisSubset("ansi", "2003-09", "2009-02"), AxisSubset("Lat", 27.09), AxisSubset("Long", 64)])
+
+        res = self.dbc.execute_array(query)
+        csv = self.dbc.execute_array(query, encoding=Query.Types.csv)
+
+        self.assertEqual(res.shape, (66,))
+        self.assertTrue(all(abs(a - b) < 1e-4 for a, b in zip(res, csv)))
+        self.assertAlmostEqual(res.min(), 14.409449, places=4)
+
+        # The query itself keeps its encoding
+        self.assertEqual(query.return_type, None)
+
+        query.set_aggregation_method(Query.AggregationMethod.min)
+        self.assertAlmostEqual(self.dbc.execute_array(query)[0], 14.409449, places=4)
+            
+
+    def test_shift_month(self):
+        """
+        Test moving ansi dates by months across years.
+        """
+
+        self.assertEqual(AxisSubset.shift_month("2014-12", 1), "2015-01")
+        self.assertEqual(AxisSubset.shift_month("2014-01-01", -1), "2013-12-01")
+        self.assertEqual(AxisSubset.shift_month("not a date", 1), None)
+
+    def test_incremental(self):
+        """
+        Test that a growing ansi range only fetches the new months,
+        and gives the same result as fetching everything.
+        """
+
+        query = Query(["AvgLandTemp"])
+        query.set_aggregation_method(Query.AggregationMethod.avg)
+        datacube = dco(self.dbc, query)
+        store = IncrementalStore()
+
+        query.set_subset([AxisSubset("ansi", "2007-04", "2008-12"), AxisSubset("Lat", 43), AxisSubset("Long", 57)])
+        datacube.execute_incremental(store)
+
+        query.set_subset([AxisSubset("ansi", "2007-04", "2009-02"), AxisSubset("Lat", 43), AxisSubset("Long", 57)])
+        res = datacube.execute_incremental(store)
+
+        # Same value as test_average, which fetches the whole range at once
+        self.assertAlmostEqual(res, 23.58781221120254, places=4)
+
+        chunks = list(store._entries.values())[0]
+        self.assertEqual([(chunk["start"], chunk["stop"]) for chunk in chunks],
+                         [("2007-04", "2008-12"), ("2009-01", "2009-02")])
+            
+
+    def test_extract_points_grid(self):
+        """
+        Test that points sharing a box are matched to their own cells, on a synthetic
+        grid whose Lat rows go from north to south.
+        """
+
+        grid = {"Lat": (89.5, -1.0), "Long": (-179.5, 1.0)}
+
+        class GridConnector:
+            # Answers like rasdaman: every cell that overlaps the trim, in grid order,
+            # with the value time * 100000 + Lat cell * 1000 + Long cell.
+            def execute_query(self, query):
+                subset = {ax.axis: ax for ax in query.subset}
+
+                def cells(axis):
+                    origin, resolution = grid[axis]
+                    lo, hi = subset[axis].start, subset[axis].stop
+                    return [k for k in range(360)
+                            if origin + k * resolution - abs(resolution) / 2 < hi
+                            and origin + k * resolution + abs(resolution) / 2 > lo]
+
+                return json.dumps([[[t * 100000 + lat * 1000 + long for long in cells("Long")]
+                                    for lat in cells("Lat")] for t in range(3)])
+
+        datacube = dco(GridConnector(), Query(["AvgLandTemp"]))
+
+        lats = [1.05, 0.2, 1.95, 0.7]
+        longs = [0.3, 1.6, 1.1, 0.9]
+        res = datacube.extract_points(lats, longs, "2003-09", "2003-11", grid=grid)
+
+        # All four points fit in one 2 degree box
+        self.assertEqual(len(dco._plan_boxes(lats, longs, 2.0)), 1)
+
+        for i, (lat, long) in enumerate(zip(lats, longs)):
+            lat_cell = int(89.5 - lat + 0.5)
+            long_cell = int(long + 179.5 + 0.5)
+            self.assertEqual(res[i].tolist(), [t * 100000 + lat_cell * 1000 + long_cell for t in range(3)])
+            
+
+    def test_get_grid(self):
+        """
+        Test reading origin and resolution from a DescribeCoverage document.
+        """
+
+        document = b"""<wcs:CoverageDescriptions xmlns:wcs="http://www.opengis.net/wcs/2.0"
+            xmlns:gml="http://www.opengis.net/gml/3.2" xmlns:gmlrgrid="http://www.opengis.net/gml/3.3/rgrid">
+          <wcs:CoverageDescription>
+            <gml:boundedBy><gml:Envelope axisLabels="Lat Long ansi" srsDimension="3">
+              <gml:lowerCorner>-90 -180 "2000-02-01T00:00:00.000Z"</gml:lowerCorner>
+              <gml:upperCorner>90 180 "2015-06-01T00:00:00.000Z"</gml:upperCorner>
+            </gml:Envelope></gml:boundedBy>
+            <gml:domainSet><gmlrgrid:ReferenceableGridByVectors>
+              <gml:axisLabels>ansi Lat Long</gml:axisLabels>
+              <gmlrgrid:origin><gml:Point><gml:pos>89.95 -179.95 "2000-02-01T00:00:00.000Z"</gml:pos></gml:Point></gmlrgrid:origin>
+              <gmlrgrid:generalGridAxis><gmlrgrid:GeneralGridAxis><gmlrgrid:offsetVector>0 0 1</gmlrgrid:offsetVector></gmlrgrid:GeneralGridAxis></gmlrgrid:generalGridAxis>
+              <gmlrgrid:generalGridAxis><gmlrgrid:GeneralGridAxis><gmlrgrid:offsetVector>-0.1 0 0</gmlrgrid:offsetVector></gmlrgrid:GeneralGridAxis></gmlrgrid:generalGridAxis>
+              <gmlrgrid:generalGridAxis><gmlrgrid:GeneralGridAxis><gmlrgrid:offsetVector>0 0.1 0</gmlrgrid:offsetVector></gmlrgrid:GeneralGridAxis></gmlrgrid:generalGridAxis>
+            </gmlrgrid:ReferenceableGridByVectors></gml:domainSet>
+          </wcs:CoverageDescription>
+        </wcs:CoverageDescriptions>"""
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                self.send_response(200)
+                self.end_headers()
+                self.wfile.write(document)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            grid = dbc(f"http://127.0.0.1:{server.server_port}/ows").get_grid("AvgLandTemp")
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        self.assertEqual(grid, {"Lat": (89.95, -0.1), "Long": (-179.95, 0.1)})
+
+
+    def test_progressive_failed_preview(self):
+        """
+        Test that a failed preview is not cached, so it is sent again the next time.
+        """
+
+        class FlakyConnector:
+            def __init__(self):
+                self.previews = 0
+
+            def execute_query(self, query, raise_errors=False):
+                if "scale" in str(query):
+                    self.previews += 1
+                    if self.previews == 1:
+                        raise ConnectionError("server unavailable")
+                return "{1,2},{3,4}"
+
+        connector = FlakyConnector()
+        query = Query(["AvgLandTemp"])
+        query.set_subset([AxisSubset("ansi", "2014-07"), AxisSubset("Lat", -20, 30), AxisSubset("Long", 10, 30)])
+        datacube = dco(connector, query)
+
+        scale, subset, data = next(datacube.execute_progressive(scales=(0.25,)))
+        self.assertIn("server unavailable", data)
+        self.assertEqual(len(datacube.cache), 0)
+
+        scale, subset, data = next(datacube.execute_progressive(scales=(0.25,)))
+        self.assertEqual(data, "{1,2},{3,4}")
+        self.assertEqual(connector.previews, 2)
+
+    def test_display_progressive_tiles(self):
+        """
+        Test that full resolution tiles are drawn over their own part of the preview.
+        """
+
+        subset = [AxisSubset("ansi", "2014-07"), AxisSubset("Lat", -20, 30), AxisSubset("Long", 10, 30)]
+        results = [(0.25, subset, "{1,2},{3,4}")]
+        results += [(1, tile, "{1,2},{3,4}") for tile in dco._split_subset(subset, 2)]
+
+        renderer = DataVisualizer.Renderer()
+        DataVisualizer._screen_renderer = renderer
+        try:
+            DataVisualizer.display_progressive(results)
+        finally:
+            DataVisualizer._screen_renderer = None
+
+        self.assertEqual(tuple(renderer.image.get_extent()), (10, 30, -20, 30))
+        self.assertEqual(sorted(tuple(tile.get_extent()) for tile in renderer.tiles),
+                         [(10, 20, -20, 5), (10, 20, 5, 30), (20, 30, -20, 5), (20, 30, 5, 30)])
+
+
+    def test_renderer_closed_window(self):
+        """
+        Test that the screen renderer opens a new figure after its window was closed.
+        """
+
+        renderer = DataVisualizer.Renderer(interactive=True)
+        renderer.update([1, 2, 3])
+        first = renderer.figure
+
+        plt.close(first)
+        renderer.update([3, 2, 1])
+
+        self.assertIsNot(renderer.figure, first)
+        self.assertTrue(plt.fignum_exists(renderer.figure.number))
+        self.assertEqual(renderer.line.get_ydata().tolist(), [3, 2, 1])
+        plt.close(renderer.figure)
+
+
+    def test_decode_many_shared_memory(self):
+        """
+        Test that decode_many removes every shared memory block exactly once,
+        also when one of the payloads cannot be decoded.
+        """
+
+        package_dir = os.path.dirname(os.path.realpath(__file__)) + "/.."
+
+        code = "\n".join([
+            "import io",
+            "from PIL import Image",
+            "from wdc import Decoder",
+            "buffer = io.BytesIO()",
+            "Image.new('L', (4, 3)).save(buffer, format='png')",
+            "image = buffer.getvalue()",
+            "print([array.shape for array in Decoder.decode_many([image] * 3, processes=2)])",
+            "try:",
+            "    Decoder.decode_many([image, b'\\xff not an image', image, image], processes=2)",
+            "except Exception:",
+            "    print('failed')",
+        ])
+        res = subprocess.run([sys.executable, "-c", code], cwd=package_dir, capture_output=True, text=True)
+
+        self.assertEqual(res.stdout.split(), ["[(3,", "4),", "(3,", "4),", "(3,", "4)]", "failed"])
+        # The resource tracker complains about blocks that are unregistered twice or leaked
+        self.assertEqual(res.stderr, "")
+
+
+    def test_prefetching_failures(self):
+        """
+        Test that failed prefetches are neither cached nor counted as hits, and that
+        the prefetcher remembers at most as many prefetched keys as the cache holds.
+        """
+
+        class FlakyConnector:
+            def __init__(self):
+                self.sent = []
+
+            def execute_query(self, query, raise_errors=False):
+                self.sent.append(query)
+                # The first request for February fails
+                if "2014-02" in query and self.sent.count(query) == 1:
+                    raise ConnectionError("server unavailable")
+                return "1"
+
+        def wait_for_prefetches(prefetcher):
+            for future in list(prefetcher._pending.values()):
+                try:
+                    future.result()
+                except ConnectionError:
+                    pass
+
+        connector = FlakyConnector()
+        query = Query(["AvgLandTemp"])
+        datacube = dco(connector, query, cache=ResultCache(max_entries=2))
+        prefetcher = datacube.enable_prefetching(budget=2, max_workers=1)
+
+        query.set_subset([AxisSubset("ansi", "2014-01")])
+        datacube.execute_query()
+        wait_for_prefetches(prefetcher)
+
+        query.set_subset([AxisSubset("ansi", "2014-02")])
+        february = query.get_wcps()
+        self.assertNotIn(february, datacube.cache)
+
+        # The failed prefetch is sent again instead of answering with its error
+        self.assertEqual(datacube.execute_query(), "1")
+        self.assertEqual(connector.sent.count(february), 2)
+        self.assertEqual(prefetcher.statistics()["hits"], 0)
+
+        for month in ["2014-05", "2014-08", "2014-11", "2015-02"]:
+            query.set_subset([AxisSubset("ansi", month)])
+            datacube.execute_query()
+            wait_for_prefetches(prefetcher)
+        datacube.disable_prefetching()
+
+        self.assertLessEqual(len(prefetcher._prefetched_keys), 2)
+
+
+    def test_decode_text(self):
+        """
+        Test that the decoder and the visualizer read csv results the same way.
+        """
+
+        from wdc import Decoder
+
+        cases = [("1 2 3", [1, 2, 3]), ("1,2,3", [1, 2, 3]), ("{1 2 3}", [1, 2, 3]),
+                 ("{1,2},{3,4}", [[1, 2], [3, 4]]), ("{1, 2}, {3, 4}", [[1, 2], [3, 4]])]
+
+        for text, expected in cases:
+            self.assertEqual(Decoder.decode(text.encode()).tolist(), expected)
+            self.assertEqual(DataVisualizer.Renderer._to_array(text).tolist(), expected)
+
+        with self.assertRaises(DataVisualizer.NondecodableBytesError):
+            DataVisualizer.Renderer._to_array("HTTP error occurred")
+
+
+    def test_incremental_refetch(self):
+        """
+        Test that refetch only sends the last months again, for series and aggregates,
+        with a connector whose value for every month is its month index.
+        """
+
+        class MonthConnector:
+            def __init__(self):
+                self.ranges = []
+
+            def execute_array(self, query, dimensions=None, encoding=None):
+                import numpy as np
+
+                ansi = [ax for ax in query.subset if ax.axis == "ansi"][0]
+                self.ranges.append((ansi.start, ansi.stop))
+
+                first = AxisSubset.month_index(ansi.start)[0]
+                last = AxisSubset.month_index(ansi.stop)[0]
+                values = [float(month) for month in range(first, last + 1)]
+
+                if query.aggregate == None:
+                    return np.asarray(values)
+                if "* 0 + 1" in query.return_value:
+                    return np.asarray([float(len(values))])
+                return np.asarray([sum(values)])
+
+        def months(start, stop):
+            return [float(month) for month in range(AxisSubset.month_index(start)[0],
+                                                    AxisSubset.month_index(stop)[0] + 1)]
+
+        for aggregate in [None, Query.AggregationMethod.avg]:
+            connector = MonthConnector()
+            query = Query(["AvgLandTemp"])
+            query.set_aggregation_method(aggregate)
+            datacube = dco(connector, query)
+            store = IncrementalStore()
+
+            query.set_subset([AxisSubset("ansi", "2007-01", "2007-12"), AxisSubset("Lat", 43), AxisSubset("Long", 57)])
+            datacube.execute_incremental(store, refetch=2)
+
+            connector.ranges = []
+            query.set_subset([AxisSubset("ansi", "2007-01", "2008-02"), AxisSubset("Lat", 43), AxisSubset("Long", 57)])
+            res = datacube.execute_incremental(store, refetch=2)
+
+            expected = months("2007-01", "2008-02")
+            chunks = [(chunk["start"], chunk["stop"]) for chunk in list(store._entries.values())[0]]
+
+            if aggregate == None:
+                self.assertEqual(res.tolist(), expected)
+                # Only the two refetched months and the two new ones are sent
+                self.assertEqual(connector.ranges, [("2007-11", "2008-02")])
+                self.assertEqual(chunks, [("2007-01", "2007-10"), ("2007-11", "2008-02")])
+            else:
+                self.assertAlmostEqual(res, sum(expected) / len(expected))
+                # Sum and number of cells, for the refetched months and the new ones
+                self.assertEqual(sorted(set(connector.ranges)), [("2007-11", "2007-12"), ("2008-01", "2008-02")])
+                self.assertEqual(len(connector.ranges), 4)
+                self.assertEqual(chunks, [("2007-01", "2007-10"), ("2007-11", "2007-12"), ("2008-01", "2008-02")])
+            
             
 if __name__=='__main__':
     unittest.main()
\ No newline at end of file
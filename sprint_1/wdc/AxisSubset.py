@@ -1,3 +1,5 @@
+import re
+
 class AxisSubset:
     """
     AxisSubset class to implement WCPS axis subsets.
@@ -36,3 +38,35 @@ class AxisSubset:
         Returns the WCPS equivalent of the query.
         """
         return str(self)
+
+    @staticmethod
+    def month_index(value: str):
+        """
+        Splits a date such as "2014-07" or "2014-07-01" into the number of months since
+        year 0 and the rest of the date, or returns None if it is not a date.
+
+        Parameters:
+            value (str) -> The date.
+        """
+        match = re.match(r"^(\d{4})-(\d{2})(.*)$", value)
+        if match == None:
+            return None
+        return int(match.group(1)) * 12 + int(match.group(2)) - 1, match.group(3)
+
+    @staticmethod
+    def shift_month(value: str, months: int):
+        """
+        Returns the date that is the given number of months after value (before, if it
+        is negative), keeping the rest of the date. Returns None if value is not a date.
+
+        Parameters:
+            value (str) -> The date, e.g. "2014-07".
+
+            months (int) -> Number of months to move.
+        """
+        month = AxisSubset.month_index(value)
+        if month == None:
+            return None
+
+        count, rest = month[0] + months, month[1]
+        return f"{count // 12:04d}-{count % 12 + 1:02d}{rest}"
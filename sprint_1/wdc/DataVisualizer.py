@@ -1,8 +1,16 @@
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import io
+
 class DataVisualizer:
     """
     DataVisualizer class to display the data received after a WCPS query.
 
     It contains methods of data visualization.
+
+    Inner Classes:
+        Renderer -> A class that draws series and rasters on a figure that is reused
+        between updates, either on screen or into image buffers.
     """
 
     @staticmethod
@@ -25,6 +33,7 @@ class DataVisualizer:
             except UnicodeDecodeError:
                 # If decoding fails, assume it might be an image
                 try:
+                    from PIL import Image
                     image = Image.open(io.BytesIO(result))
                     image.show()
                 except IOError:
@@ -36,16 +45,389 @@ class DataVisualizer:
         elif isinstance(result, list):
             # If it's a list, assume it's CSV data and try to plot it as a graph
             try:
-                import pandas as pd
-                df = pd.DataFrame(result)
-                df.plot()
-                plt.show()
+                DataVisualizer._get_screen_renderer().update(result)
             except Exception as e:
                 print("Failed to plot the data as a graph.")
         else:
             raise DataVisualizer.NondecodableBytesError(
                 "Visualizer cannot decode the data")
 
+    @staticmethod
+    def display_progressive(results):
+        """
+        Displays the results of dco.execute_progressive as they arrive,
+        starting from the coarse previews and ending with the full resolution tiles.
+
+        Rasters are placed by their subset: columns run along the second and rows along
+        the first trimmed numeric axis (e.g. Long and Lat), so every full resolution tile
+        is drawn over its own part of the preview.
+
+        Parameters:
+            results (Iterable) -> The (scale, subset, data) tuples from dco.execute_progressive.
+        """
+
+        renderer = DataVisualizer._get_screen_renderer()
+
+        for scale, subset, data in results:
+            extent = DataVisualizer._extent(subset)
+            try:
+                if scale < 1 or extent == None:
+                    # Previews replace each other on the same figure
+                    renderer.update(data, extent)
+                else:
+                    renderer.add_tile(data, extent)
+            except DataVisualizer.NondecodableBytesError:
+                DataVisualizer.display_result(data)
+
+    @staticmethod
+    def render_batch(results, format: str = "png", max_workers: int = 4,
+                     width: int = 800, height: int = 600):
+        """
+        Renders many results into image files in memory, using background threads.
+
+        Each thread keeps its own off-screen Renderer, so figures are created once per
+        thread instead of once per result. Nothing is shown on the screen, which makes
+        this suitable for generating reports.
+
+        Parameters:
+            results (Iterable) -> The data to render (see Renderer.update).
+
+            format (str) = "png" -> The image format, e.g. "png", "svg" or "pdf".
+
+            max_workers (int) = 4 -> Number of threads that render at the same time.
+
+            width (int) = 800 -> Width of the images in pixels.
+
+            height (int) = 600 -> Height of the images in pixels.
+
+        Return:
+            images (List[bytes]) -> The rendered images, in the same order as results.
+        """
+
+        local = threading.local()
+
+        def render(data):
+            if not hasattr(local, "renderer"):
+                local.renderer = DataVisualizer.Renderer(width, height)
+            return local.renderer.render(data, format)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(render, results))
+
+    @staticmethod
+    def downsample_series(values, width: int):
+        """
+        Reduces a series to about 2 * width points with min-max decimation.
+
+        The series is split into width buckets and only the smallest and the largest
+        value of each bucket is kept (in their original order), so peaks are still
+        visible when the series is drawn width pixels wide. A bucket that is only NaN
+        (e.g. a nodata gap) keeps a single NaN, so the gap stays visible too.
+
+        Parameters:
+            values (array-like) -> The series to reduce.
+
+            width (int) -> The number of buckets, usually the width of the plot in pixels.
+
+        Return:
+            (x, y) (numpy.ndarray, numpy.ndarray) -> The indices of the kept values and the values.
+        """
+        import numpy as np
+
+        values = np.asarray(values, dtype=float).ravel()
+        n = len(values)
+
+        if n <= 2 * width:
+            return np.arange(n), values
+
+        bucket = -(-n // width)
+        full = (n // bucket) * bucket
+
+        buckets = values[:full].reshape(-1, bucket)
+        starts = np.arange(0, full, bucket)
+
+        # Buckets that are all NaN (nodata gaps) only keep their first index,
+        # whose NaN value leaves a gap in the line
+        empty = np.isnan(buckets).all(axis=1)
+        buckets = np.where(empty[:, None], 0.0, buckets)
+        lows = np.where(empty, starts, starts + np.nanargmin(buckets, axis=1))
+        highs = np.where(empty, starts, starts + np.nanargmax(buckets, axis=1))
+
+        # Keep min and max of each bucket in the order they appear
+        x = np.sort(np.stack([lows, highs], axis=1), axis=1).ravel()
+
+        if full < n:
+            tail = values[full:]
+            if np.isnan(tail).all():
+                x = np.concatenate([x, [full]])
+            else:
+                x = np.concatenate([x, np.sort([full + np.nanargmin(tail), full + np.nanargmax(tail)])])
+
+        # An index that is both min and max of its bucket, or stands for a gap, is kept once
+        x = x[np.concatenate([[True], x[1:] != x[:-1]])]
+
+        return x, values[x]
+
+    @staticmethod
+    def downsample_raster(values, width: int, height: int):
+        """
+        Reduces a raster to at most height x width cells by keeping every n-th row and column.
+
+        Parameters:
+            values (array-like) -> The raster, with shape (rows, columns) or (rows, columns, bands).
+
+            width (int) -> The largest number of columns to keep.
+
+            height (int) -> The largest number of rows to keep.
+
+        Return:
+            raster (numpy.ndarray) -> The reduced raster.
+        """
+        import numpy as np
+
+        values = np.asarray(values)
+
+        row_step = max(1, -(-values.shape[0] // height))
+        column_step = max(1, -(-values.shape[1] // width))
+
+        return values[::row_step, ::column_step]
+
+    @staticmethod
+    def _extent(subset):
+        """
+        Returns the (left, right, bottom, top) of a raster with the given subset, or None
+        if the subset does not have two trimmed numeric axes.
+        """
+
+        if subset == None:
+            return None
+
+        axes = [ax for ax in subset if ax.stop != None and not isinstance(ax.start, str)][:2]
+        if len(axes) < 2:
+            return None
+
+        rows, columns = axes
+        return (columns.start, columns.stop, rows.start, rows.stop)
+
+    @staticmethod
+    def _get_screen_renderer():
+        """
+        Returns the Renderer that display functions share, creating it the first time.
+        """
+        if DataVisualizer._screen_renderer == None:
+            DataVisualizer._screen_renderer = DataVisualizer.Renderer(interactive=True)
+        return DataVisualizer._screen_renderer
+
+    _screen_renderer = None
+
+    class Renderer:
+        """
+        DataVisualizer.Renderer class that draws query results on a reusable figure.
+
+        The figure, the line of a series and the image of a raster are only created
+        the first time they are needed; later updates replace their data, which is much
+        faster than building a new plot. Data is downsampled to the size of the figure
+        before it is drawn. If the window of an interactive figure was closed, the next
+        update opens a new one.
+
+        A Renderer should only be used by one thread at a time.
+
+        Object Attributes:
+            width (int) = 800 -> Width of the figure in pixels.
+
+            height (int) = 600 -> Height of the figure in pixels.
+
+            interactive (bool) = False -> Whether the figure is shown on the screen.
+            If it is False, the figure is drawn off-screen and can only be rendered to buffers.
+        """
+
+        def __init__(self, width: int = 800, height: int = 600, interactive: bool = False):
+            self.width = width
+            self.height = height
+            self.interactive = interactive
+            self.figure = None
+            self.axes = None
+            self.line = None
+            self.image = None
+            self.tiles = []
+
+        def update(self, data, extent=None):
+            """
+            Draws the data on the figure, reusing the existing line or image.
+            Tiles drawn by add_tile are removed.
+
+            Parameters:
+                data (any) -> Image bytes (png, jpeg, tiff, gif), CSV text, a list or a
+                numpy array. One dimensional data is drawn as a series, two or three
+                dimensional data as a raster.
+
+                extent (Tuple[float, float, float, float]) = None -> (left, right, bottom, top)
+                of a raster in axis units. If it is None, the raster is drawn in pixels.
+            """
+
+            values = DataVisualizer.Renderer._to_array(data)
+
+            if self.figure == None or self._closed():
+                self._create_figure()
+
+            for tile in self.tiles:
+                tile.remove()
+            self.tiles = []
+
+            if values.ndim == 1:
+                x, y = DataVisualizer.downsample_series(values, self.width)
+                self._draw_series(x, y)
+            elif values.ndim in (2, 3):
+                self._draw_raster(DataVisualizer.downsample_raster(values, self.width, self.height), extent)
+            else:
+                raise DataVisualizer.NondecodableBytesError(
+                    f"Cannot draw data with {values.ndim} dimensions")
+
+            self._show()
+
+        def add_tile(self, data, extent):
+            """
+            Draws a raster over a part of the figure, on top of the current image,
+            instead of replacing it.
+
+            Parameters:
+                data (any) -> Two or three dimensional data (see update).
+
+                extent (Tuple[float, float, float, float]) -> (left, right, bottom, top)
+                of the tile in axis units.
+            """
+
+            values = DataVisualizer.Renderer._to_array(data)
+            if values.ndim not in (2, 3):
+                raise DataVisualizer.NondecodableBytesError(
+                    f"Cannot draw a tile with {values.ndim} dimensions")
+
+            if self.figure == None or self._closed():
+                self._create_figure()
+
+            values = DataVisualizer.downsample_raster(values, self.width, self.height)
+
+            # Share the colour scale of the preview, so tiles and preview look the same
+            norm = self.image.norm if self.image != None and values.ndim == 2 else None
+            self.tiles.append(self.axes.imshow(values, extent=extent, norm=norm))
+
+            if self.image == None:
+                extents = [tile.get_extent() for tile in self.tiles]
+                self.axes.set_xlim(min(e[0] for e in extents), max(e[1] for e in extents))
+                self.axes.set_ylim(min(e[2] for e in extents), max(e[3] for e in extents))
+
+            self._show()
+
+        def render(self, data, format: str = "png"):
+            """
+            Draws the data and returns the figure as an image file in memory.
+
+            Parameters:
+                data (any) -> The data to draw (see update).
+
+                format (str) = "png" -> The image format, e.g. "png", "svg" or "pdf".
+
+            Return:
+                image (bytes) -> The rendered image.
+            """
+            self.update(data)
+
+            buffer = io.BytesIO()
+            self.figure.savefig(buffer, format=format)
+            return buffer.getvalue()
+
+        def _create_figure(self):
+            dpi = 100
+            size = (self.width / dpi, self.height / dpi)
+
+            if self.interactive:
+                import matplotlib.pyplot as plt
+                self.figure = plt.figure(figsize=size, dpi=dpi)
+            else:
+                # A figure without pyplot is not tied to a GUI, so it can be used in any thread
+                from matplotlib.figure import Figure
+                from matplotlib.backends.backend_agg import FigureCanvasAgg
+                self.figure = Figure(figsize=size, dpi=dpi)
+                FigureCanvasAgg(self.figure)
+
+            self.axes = self.figure.add_subplot()
+            self.line = None
+            self.image = None
+            self.tiles = []
+
+        def _closed(self):
+            """
+            Whether the user closed the window of the figure.
+            """
+            if not self.interactive:
+                return False
+
+            import matplotlib.pyplot as plt
+            return not plt.fignum_exists(self.figure.number)
+
+        def _show(self):
+            if self.interactive:
+                import matplotlib.pyplot as plt
+
+                # Draw without blocking, so the caller can keep working
+                self.figure.canvas.draw_idle()
+                plt.show(block=False)
+                plt.pause(0.001)
+
+        def _draw_series(self, x, y):
+            if self.image != None:
+                self.image.remove()
+                self.image = None
+
+            if self.line == None:
+                (self.line,) = self.axes.plot(x, y)
+            else:
+                self.line.set_data(x, y)
+
+            self.axes.relim()
+            self.axes.autoscale_view()
+
+        def _draw_raster(self, values, extent=None):
+            import numpy as np
+
+            if self.line != None:
+                self.line.remove()
+                self.line = None
+
+            if extent == None:
+                extent = (-0.5, values.shape[1] - 0.5, values.shape[0] - 0.5, -0.5)
+
+            if self.image == None:
+                self.image = self.axes.imshow(values, extent=extent)
+            else:
+                self.image.set_data(values)
+                self.image.set_extent(extent)
+                self.axes.set_xlim(extent[0], extent[1])
+                self.axes.set_ylim(extent[2], extent[3])
+
+            if values.ndim == 2 and not np.isnan(values).all():
+                self.image.set_clim(np.nanmin(values), np.nanmax(values))
+
+        @staticmethod
+        def _to_array(data):
+            """
+            Converts the data that a query returns to a numpy array.
+            """
+            import numpy as np
+            from wdc.Decoder import Decoder
+
+            if isinstance(data, str):
+                data = data.encode('utf-8')
+
+            if isinstance(data, bytes):
+                try:
+                    return Decoder.decode(data)
+                except (ValueError, OSError):
+                    raise DataVisualizer.NondecodableBytesError(
+                        "Visualizer cannot decode the data")
+
+            return np.asarray(data)
+
     class NondecodableBytesError(Exception):
         """
         Raised when the visualizer cannot display the result.
@@ -0,0 +1,178 @@
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import List
+import io
+import json
+import re
+
+from wdc.Query import Query
+
+class Decoder:
+    """
+    Decoder class to turn query results into numpy arrays.
+
+    Images (png, jpeg, tiff, gif) are decoded with PIL, netcdf with the optional netCDF4 package
+    and csv or json as text. Decoding is CPU-bound, so many images can be decoded in a
+    pool of processes with decode_many. The payloads and the decoded arrays are passed
+    through shared memory instead of being pickled.
+    """
+
+    @staticmethod
+    def decode(payload: bytes, encoding: str = None):
+        """
+        Decodes a single result into an array.
+
+        Text is read as rasdaman csv: values are separated by commas or spaces
+        and every row of a raster is wrapped in braces, e.g. "{1 2},{3 4}".
+
+        Parameters:
+            payload (bytes) -> The result, as the server sends it.
+
+            encoding (str) = None -> One of Query.Types. If it is None, text results
+            are read as numbers and anything else as an image.
+
+        Return:
+            data (numpy.ndarray) -> For images, an array of shape (rows, columns) or
+            (rows, columns, bands). Otherwise it has one axis per axis of the result.
+        """
+        import numpy as np
+
+        if encoding == Query.Types.netcdf:
+            return Decoder._decode_netcdf(payload)
+
+        if encoding == Query.Types.json:
+            return np.asarray(json.loads(payload), dtype=float)
+
+        if encoding in (None, Query.Types.csv):
+            try:
+                text = payload.decode('utf-8')
+            except UnicodeDecodeError:
+                text = None
+
+            if text != None:
+                return np.asarray(Decoder._parse_text(text), dtype=float)
+
+        from PIL import Image
+
+        with Image.open(io.BytesIO(payload)) as image:
+            return np.asarray(image)
+
+    @staticmethod
+    def _parse_text(text: str):
+        """
+        Reads numbers as rasdaman writes them in csv, e.g. "1 2 3", "1,2,3" or "{1,2},{3,4}",
+        where every row of a raster is wrapped in braces. A single row is read as a series.
+
+        Raises ValueError if the text contains anything else.
+        """
+
+        text = text.strip().replace("{", "[").replace("}", "]")
+        # Values are separated by commas or by spaces
+        text = re.sub(r"\s*([\[\],])\s*", r"\1", text)
+        text = re.sub(r"\s+", ",", text)
+        text = text.replace("][", "],[")
+        # float() also reads nan and inf, which json does not
+        text = re.sub(r"[^\[\],]+", lambda match: json.dumps(float(match.group())), text)
+
+        values = json.loads("[" + text + "]")
+        if len(values) == 1 and isinstance(values[0], list):
+            return values[0]
+        return values
+
+    @staticmethod
+    def decode_many(payloads: List[bytes], processes: int = None):
+        """
+        Decodes many images in a pool of processes.
+
+        Parameters:
+            payloads (List[bytes]) -> The images, as the server sends them.
+
+            processes (int) = None -> Number of processes. If it is None, one process
+            is started for every CPU core.
+
+        Return:
+            data (List[numpy.ndarray]) -> The decoded arrays, in the same order as payloads.
+        """
+        import numpy as np
+
+        # Every block is created and unlinked exactly once. Attaching registers it again
+        # with the resource tracker that the pool shares, which is not counted, so the
+        # unlink() of the caller is the only unregister.
+        inputs = []
+        try:
+            for payload in payloads:
+                block = shared_memory.SharedMemory(create=True, size=max(len(payload), 1))
+                block.buf[:len(payload)] = payload
+                inputs.append(block)
+
+            with ProcessPoolExecutor(max_workers=processes) as executor:
+                futures = [executor.submit(Decoder._decode_shared, block.name, len(payload))
+                           for block, payload in zip(inputs, payloads)]
+
+                collected = 0
+                try:
+                    arrays = []
+                    for future in futures:
+                        name, shape, dtype = future.result()
+                        collected += 1
+
+                        block = shared_memory.SharedMemory(name=name)
+                        try:
+                            arrays.append(np.ndarray(shape, dtype=dtype, buffer=block.buf).copy())
+                        finally:
+                            block.close()
+                            block.unlink()
+
+                    return arrays
+                finally:
+                    # If a decode failed, remove the blocks that the other decodes wrote
+                    executor.shutdown(wait=True, cancel_futures=True)
+                    for future in futures[collected:]:
+                        if not future.cancelled() and future.exception() == None:
+                            block = shared_memory.SharedMemory(name=future.result()[0])
+                            block.close()
+                            block.unlink()
+        finally:
+            for block in inputs:
+                block.close()
+                block.unlink()
+
+    @staticmethod
+    def _decode_shared(name: str, size: int):
+        """
+        Runs in a worker process. Decodes the payload in the shared memory block
+        with the given name and writes the array into a new block.
+
+        Return:
+            (name, shape, dtype) -> Where the caller can find the decoded array.
+        """
+        import numpy as np
+
+        block = shared_memory.SharedMemory(name=name)
+        try:
+            data = Decoder.decode(bytes(block.buf[:size]))
+        finally:
+            block.close()
+
+        # The caller unlinks the output block after it copied the array
+        output = shared_memory.SharedMemory(create=True, size=max(data.nbytes, 1))
+        np.ndarray(data.shape, dtype=data.dtype, buffer=output.buf)[...] = data
+        output.close()
+
+        return output.name, data.shape, data.dtype.str
+
+    @staticmethod
+    def _decode_netcdf(payload: bytes):
+        """
+        Returns the first data variable (i.e. band) of a netcdf file in memory.
+        """
+        import numpy as np
+        from netCDF4 import Dataset
+
+        with Dataset("result.nc", memory=payload) as dataset:
+            for name, variable in dataset.variables.items():
+                # Variables that are named after a dimension hold the coordinates of an axis
+                if name not in dataset.dimensions:
+                    return np.ma.filled(variable[:].astype(float), np.nan)
+
+        raise ValueError("The netcdf result does not contain any data")
@@ -0,0 +1,81 @@
+import json
+import os
+import threading
+
+class IncrementalStore:
+    """
+    IncrementalStore class to remember what dco.execute_incremental fetched before.
+
+    For every query shape (the query without its ansi subset), the store keeps a list
+    of chunks. A chunk is one ansi range that was fetched in a single request, with its
+    result: the values of a time series, or the partial aggregate of that range.
+
+    If a path is given, the store is kept in that JSON file, so later runs (e.g. the next
+    nightly job) only fetch the months that were not fetched yet.
+
+    Object Attributes:
+        path (str) = None -> The path of the JSON file. If it is None, the store
+        is only kept in memory.
+    """
+
+    def __init__(self, path: str = None):
+        self.path = path
+        self._entries = {}
+        self._lock = threading.Lock()
+
+        if path != None and os.path.exists(path):
+            with open(path, encoding="utf-8") as store_file:
+                self._entries = json.load(store_file)
+
+    def get(self, key: str):
+        """
+        Returns the chunks that are stored for a query shape, or an empty list.
+
+        Parameters:
+            key (str) -> The query shape.
+
+        Return:
+            chunks (List[dict]) -> Chunks with "start", "stop" and "value", ordered by start.
+        """
+        with self._lock:
+            return list(self._entries.get(key, []))
+
+    def put(self, key: str, chunks):
+        """
+        Replaces the chunks of a query shape and saves the store to its file.
+
+        Parameters:
+            key (str) -> The query shape.
+
+            chunks (List[dict]) -> Chunks with "start", "stop" and "value", ordered by start.
+        """
+        with self._lock:
+            self._entries[key] = list(chunks)
+            self._save()
+
+    def clear(self, key: str = None):
+        """
+        Forgets the chunks of a query shape, or of every query shape if key is None.
+
+        Parameters:
+            key (str) = None -> The query shape.
+        """
+        with self._lock:
+            if key == None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+            self._save()
+
+    def _save(self):
+        """
+        Writes the store to its file, if it has one. The lock must be held.
+        """
+        if self.path == None:
+            return
+
+        # Write to a temporary file first, so a crash cannot leave half a store behind
+        temporary_path = self.path + ".tmp"
+        with open(temporary_path, "w", encoding="utf-8") as store_file:
+            json.dump(self._entries, store_file, separators=(",", ":"))
+        os.replace(temporary_path, self.path)
@@ -0,0 +1,250 @@
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+import copy
+import threading
+
+from wdc.AxisSubset import AxisSubset
+from wdc.Query import Query
+from wdc.ResultCache import ResultCache
+
+class Prefetcher:
+    """
+    Prefetcher class that guesses the next queries and sends them in advance.
+
+    Dashboards usually send the same query again and again with a shifted subset,
+    e.g. the next month on the ansi axis or the neighbouring area on Lat/Long.
+    After each query, the prefetcher sends the queries that are likely to come next
+    in the background and stores their results in the cache. Guesses are, in order:
+        - the same shift as between the last two queries,
+        - the previous and next month of every ansi axis,
+        - the neighbouring areas of every trimmed numeric axis.
+
+    Only successful results are stored in the cache, so a failed request is sent again
+    the next time its query is executed.
+
+    Object Attributes:
+        connector (dbc) -> The dbc object that sends the queries.
+
+        cache (ResultCache) -> The cache that prefetched results are stored in.
+
+        budget (int) = 4 -> The largest number of prefetch requests that can run at the same time.
+
+        max_workers (int) = 2 -> Number of threads that send prefetch requests.
+    """
+
+    def __init__(self, connector, cache: ResultCache, budget: int = 4, max_workers: int = 2):
+        self.connector = connector
+        self.cache = cache
+        self.budget = budget
+        self.max_workers = max_workers
+
+        self.requests = 0
+        self.hits = 0
+        self.prefetched = 0
+
+        self._previous = None
+        self._pending = {}
+        # Prefetched results that were not used yet, oldest first. Results that the cache
+        # removed cannot be used, so there are never more keys than cache entries.
+        self._prefetched_keys = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    def execute_query(self, query: Query):
+        """
+        Returns the result of the query, from the cache if it was prefetched,
+        then prefetches the queries that are likely to follow.
+
+        Parameters:
+            query (Query) -> The query to execute.
+
+        Return:
+            data (str | bytes) -> The data that server sends. Might contain an error message.
+        """
+
+        wcps = query.get_wcps()
+
+        with self._lock:
+            self.requests += 1
+            pending = self._pending.get(wcps)
+
+        data = None
+        if pending != None:
+            # Prefetch is still running, wait for it instead of sending the query again
+            try:
+                data = pending.result()
+            except Exception:
+                # The prefetch failed, the query is sent again below
+                pass
+        else:
+            data = self.cache.get(wcps)
+
+        if data != None:
+            with self._lock:
+                if self._prefetched_keys.pop(wcps, False):
+                    self.hits += 1
+        else:
+            try:
+                data = self.connector.execute_query(wcps, raise_errors=True)
+                self.cache.put(wcps, data)
+            except Exception as e:
+                # Not cached, so the next execution asks the server again
+                data = f"Unexpected error - {e}"
+
+        self._prefetch(self._predict(query))
+        self._previous = copy.deepcopy(query)
+
+        return data
+
+    def statistics(self):
+        """
+        Returns statistics that help tuning the budget.
+
+        Return:
+            statistics (dict) -> requests (queries executed), hits (queries answered by a
+            prefetch), hit_rate (hits / requests), prefetched (prefetch requests sent) and
+            accuracy (hits / prefetched).
+        """
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "hits": self.hits,
+                "hit_rate": self.hits / self.requests if self.requests > 0 else 0.0,
+                "prefetched": self.prefetched,
+                "accuracy": self.hits / self.prefetched if self.prefetched > 0 else 0.0,
+            }
+
+    def shutdown(self):
+        """
+        Stops the background threads, after the running prefetches are finished.
+        """
+        self._executor.shutdown(wait=True)
+
+    def _predict(self, query: Query):
+        """
+        Returns the queries that are likely to follow the given one, most likely first.
+        """
+
+        if query.subset == None or len(query.subset) == 0:
+            return []
+
+        subsets = []
+
+        # Same shift as between the previous query and this one
+        if self._previous != None and self._same_shape(self._previous, query):
+            shifted = [Prefetcher._shift(ax, Prefetcher._difference(previous_ax, ax))
+                       for previous_ax, ax in zip(self._previous.subset, query.subset)]
+            if None not in shifted:
+                subsets.append(shifted)
+
+        for i, ax in enumerate(query.subset):
+            if isinstance(ax.start, str):
+                # Previous and next time step
+                steps = [1, -1]
+            elif ax.stop != None:
+                # Neighbouring areas
+                steps = [ax.stop - ax.start, ax.start - ax.stop]
+            else:
+                continue
+
+            for step in steps:
+                shifted_ax = Prefetcher._shift(ax, step)
+                if shifted_ax != None:
+                    subsets.append(query.subset[:i] + [shifted_ax] + query.subset[i + 1:])
+
+        queries = []
+        for subset in subsets:
+            predicted = copy.deepcopy(query)
+            predicted.set_subset(subset)
+            queries.append(predicted)
+
+        return queries
+
+    def _prefetch(self, queries: List[Query]):
+        """
+        Sends the queries in the background, skipping the ones that are cached or
+        already running, without going over the budget.
+        """
+
+        for query in queries:
+            wcps = query.get_wcps()
+
+            with self._lock:
+                if len(self._pending) >= self.budget:
+                    return
+                if wcps in self._pending or wcps in self.cache:
+                    continue
+
+                self.prefetched += 1
+                self._pending[wcps] = self._executor.submit(self._fetch, wcps)
+
+    def _fetch(self, wcps: str):
+        try:
+            # Failures are raised to whoever waits for the prefetch, and are not cached
+            data = self.connector.execute_query(wcps, raise_errors=True)
+            self.cache.put(wcps, data)
+
+            with self._lock:
+                self._prefetched_keys[wcps] = True
+                while len(self._prefetched_keys) > self.cache.max_entries:
+                    self._prefetched_keys.popitem(last=False)
+            return data
+        finally:
+            with self._lock:
+                self._pending.pop(wcps, None)
+
+    @staticmethod
+    def _same_shape(first: Query, second: Query):
+        """
+        Whether two queries only differ in the values of their subsets.
+        """
+
+        if first.subset == None or second.subset == None or len(first.subset) != len(second.subset):
+            return False
+
+        unshifted = copy.deepcopy(first)
+        unshifted.set_subset(second.subset)
+        return unshifted.get_wcps() == second.get_wcps()
+
+    @staticmethod
+    def _difference(first: AxisSubset, second: AxisSubset):
+        """
+        Returns how far second is shifted from first, in months for ansi
+        strings and in axis units for numbers. Returns None if it cannot tell.
+        """
+
+        if isinstance(first.start, str) and isinstance(second.start, str):
+            first_month = AxisSubset.month_index(first.start)
+            second_month = AxisSubset.month_index(second.start)
+            if first_month == None or second_month == None:
+                return None
+            return second_month[0] - first_month[0]
+
+        if isinstance(first.start, str) or isinstance(second.start, str):
+            return None
+
+        return second.start - first.start
+
+    @staticmethod
+    def _shift(ax: AxisSubset, step):
+        """
+        Returns the subset moved by step (months for ansi strings, axis units for numbers),
+        or None if it cannot be moved.
+        """
+
+        if step == None:
+            return None
+
+        def move(value):
+            if value == None:
+                return None
+            if isinstance(value, str):
+                return AxisSubset.shift_month(value, step)
+            return value + step
+
+        start, stop = move(ax.start), move(ax.stop)
+        if start == None or (ax.stop != None and stop == None):
+            return None
+
+        return AxisSubset(ax.axis, start, stop)
@@ -1,6 +1,7 @@
 from typing import List, Type
 from wdc.AxisSubset import AxisSubset
 from enum import Enum
+import importlib.util
 
 class Query:
     """
@@ -30,18 +31,44 @@ class Query:
         to the coverage
 
         cases (List) = None -> The list of cases that will be converted to a WCPS switch-case.
+
+        scale (float) = None -> Factor to scale the result by on the server side.
     """
 
     class Types:
         """
         Query.Types enum class that includes encoding types that is supported by rasdaman.
-        Currently only png, jpeg, tiff, gif and csv is included.
+        Currently only png, jpeg, tiff, gif, csv, json and netcdf is included.
+
+        For numeric data, tiff (float GeoTIFF, two dimensional results only) and netcdf are
+        binary and much smaller than csv or json. most_compact picks one for a result.
+        Decoding netcdf needs the optional netCDF4 package (pip install wdc[netcdf]).
         """
         png = "image/png"
         jpeg = "image/jpeg"
         tiff = "image/tiff"
         gif = "image/gif"
         csv = "text/csv"
+        json = "application/json"
+        netcdf = "application/netcdf"
+
+        @staticmethod
+        def most_compact(dimensions: int):
+            """
+            Returns the most compact encoding for a numeric result with the given
+            number of axes, or None for a single value (which is never encoded).
+            netcdf is only chosen if the netCDF4 package is installed, otherwise json.
+
+            Parameters:
+                dimensions (int) -> Number of axes of the result.
+            """
+            if dimensions == 0:
+                return None
+            if dimensions == 2:
+                return Query.Types.tiff
+            if importlib.util.find_spec("netCDF4") == None:
+                return Query.Types.json
+            return Query.Types.netcdf
 
     class AggregationMethod:
         """
@@ -116,6 +143,7 @@ class Query:
         self.return_value = return_value
         self.aggregate = None
         self.cases = None
+        self.scale = None
 
     def set_coverages(self, new_coverages: List[str]):
         """
@@ -178,6 +206,23 @@ class Query:
         """
         self.aggregate = None
 
+    def set_scale(self, new_scale: float | None):
+        """
+        Sets the factor that the result will be scaled by on the server.
+        This wraps the returned coverage in the WCPS scale() function, so
+        a factor of 0.25 returns an image with a quarter of the width and height.
+
+        Parameters:
+            new_scale (float or None) -> The scale factor. None disables scaling.
+        """
+        self.scale = new_scale
+
+    def reset_scale(self):
+        """
+        Resets the scale factor, so the result is returned in full resolution.
+        """
+        self.scale = None
+
     def add_switch_case(self, boolean_expression: str, coverage_expression: str, 
                         default: bool = False):
         """
@@ -246,6 +291,10 @@ class Query:
             # and if there is a return type
             return_text += f" encode ("
 
+        # Scaling wraps everything that is returned
+        if self.scale != None:
+            return_text += " scale ("
+
         # Switch cases
         if self.cases != None:
             # If we have cases, create a switch case text
@@ -275,6 +324,9 @@ class Query:
         if self.cases == None:
             return_text += f" )"
 
+        if self.scale != None:
+            return_text += f" , {self.scale} )"
+
         # If there is an aggregation method
         if self.aggregate != None:
             return_text += f" )"
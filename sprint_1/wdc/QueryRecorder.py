@@ -0,0 +1,68 @@
+import json
+import threading
+
+class QueryRecorder:
+    """
+    QueryRecorder class to log every query that a dbc object executes.
+
+    Each query is appended to the log file as one compact JSON line:
+        {"t": <unix time the query was sent>, "d": <duration in seconds>,
+         "n": <response size in bytes>, "s": <HTTP status, 0 if the request failed>,
+         "q": <WCPS>}
+
+    The log can be replayed against a server with "python -m wdc.replay".
+    A recorder can be shared between threads and dbc objects.
+
+    Object Attributes:
+        path (str) -> The path of the log file. Records are added to the end of the file.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+
+    def record(self, query: str, sent_at: float, duration: float, size: int, status: int):
+        """
+        Appends a query to the log.
+
+        Parameters:
+            query (str) -> The WCPS that was sent.
+
+            sent_at (float) -> Unix time the query was sent at.
+
+            duration (float) -> Seconds until the response was received.
+
+            size (int) -> Size of the response in bytes.
+
+            status (int) -> HTTP status of the response, 0 if there was no response.
+        """
+        line = json.dumps({"t": round(sent_at, 3), "d": round(duration, 6), "n": size,
+                           "s": status, "q": query}, separators=(",", ":"))
+
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+
+    def close(self):
+        """
+        Closes the log file.
+        """
+        with self._lock:
+            self._file.close()
+
+    @staticmethod
+    def read(path: str):
+        """
+        Reads the records of a log file.
+
+        Parameters:
+            path (str) -> The path of the log file.
+
+        Return:
+            A generator of the records as dictionaries (see the class description).
+        """
+        with open(path, encoding="utf-8") as log:
+            for line in log:
+                if line.strip() != "":
+                    yield json.loads(line)
@@ -0,0 +1,74 @@
+from collections import OrderedDict
+import threading
+
+class ResultCache:
+    """
+    ResultCache class to keep the results of queries in memory.
+
+    Results are stored with the WCPS of their query as the key. When the cache is full,
+    the result that was used least recently is removed. The cache can be shared between
+    threads.
+
+    Object Attributes:
+        max_entries (int) = 128 -> The number of results the cache can hold.
+
+        hits (int) -> The number of lookups that found a result.
+
+        misses (int) -> The number of lookups that did not find a result.
+    """
+
+    def __init__(self, max_entries: int = 128):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str, default = None):
+        """
+        Returns the result that is stored for the key, or default if there is none.
+
+        Parameters:
+            key (str) -> The WCPS of the query.
+
+            default = None -> The value to return if the key is not in the cache.
+        """
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return default
+
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def put(self, key: str, value):
+        """
+        Stores a result in the cache, removing the least recently used one if it is full.
+
+        Parameters:
+            key (str) -> The WCPS of the query.
+
+            value -> The result of the query.
+        """
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """
+        Removes every result from the cache.
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def __contains__(self, key: str):
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
@@ -1,7 +1,44 @@
 # Package exports the following classes
+#
+# Submodules are only imported the first time one of their classes is used,
+# so "import wdc" stays fast and does not load requests, numpy, PIL or matplotlib.
 
-from wdc.AxisSubset import AxisSubset
-from wdc.Query import Query
-from wdc.dbc import dbc
-from wdc.dco import dco
-from wdc.DataVisualizer import DataVisualizer
\ No newline at end of file
+import importlib
+import sys
+import types
+
+_exports = {
+    "AxisSubset": "wdc.AxisSubset",
+    "Query": "wdc.Query",
+    "dbc": "wdc.dbc",
+    "dco": "wdc.dco",
+    "DataVisualizer": "wdc.DataVisualizer",
+    "ResultCache": "wdc.ResultCache",
+    "Decoder": "wdc.Decoder",
+    "Prefetcher": "wdc.Prefetcher",
+    "QueryRecorder": "wdc.QueryRecorder",
+    "IncrementalStore": "wdc.IncrementalStore",
+}
+
+__all__ = list(_exports)
+
+class _LazyPackage(types.ModuleType):
+    def __setattr__(self, name, value):
+        # Importing a submodule stores it on the package under the name of its class.
+        # Keep the class there instead, as "from wdc import Query" should give the class.
+        if name in _exports and isinstance(value, types.ModuleType):
+            value = getattr(value, name)
+        super().__setattr__(name, value)
+
+sys.modules[__name__].__class__ = _LazyPackage
+
+def __getattr__(name):
+    if name not in _exports:
+        raise AttributeError(f"module 'wdc' has no attribute '{name}'")
+
+    value = getattr(importlib.import_module(_exports[name]), name)
+    globals()[name] = value
+    return value
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -1,5 +1,9 @@
+from typing import List
+from concurrent.futures import ThreadPoolExecutor
+import time
+
 from wdc.Query import Query
-import requests
+from wdc.QueryRecorder import QueryRecorder
 
 class dbc:
     """
@@ -10,12 +14,20 @@ class dbc:
 
     Object Attributes:
         server_url (str) -> The URL of the database we are accessing to.
+
+        recorder (QueryRecorder) = None -> If it is set, every executed query is logged
+        with its duration and response size.
+
+        compression (bool) = True -> Whether the server may send responses gzip compressed.
+        They are decompressed automatically.
     """
 
-    def __init__(self, server_url: str):
+    def __init__(self, server_url: str, recorder: QueryRecorder = None, compression: bool = True):
         self.server_url = server_url
+        self.recorder = recorder
+        self.compression = compression
 
-    def execute_query(self, query: Query | str):
+    def execute_query(self, query: Query | str, raise_errors: bool = False):
         """
         Sends a query to the server, via requests.
 
@@ -25,6 +37,10 @@ class dbc:
 
         Parameters:
             query (Query | str) -> The query to send.
+
+            raise_errors (bool) = False -> Whether failed requests raise their exception
+            (e.g. requests.HTTPError) instead of returning an error message. Results that
+            are cached should be fetched this way, so error messages are never cached.
         """
 
         # If query is an instance of Query class, convert it to WCPS string.
@@ -33,23 +49,183 @@ class dbc:
         else:
             parsed_query = query
 
+        # requests is only imported when it is needed, to keep "import wdc" fast
+        import requests
+
         try:
-            response = requests.post(self.server_url, data={  'query': parsed_query})
-            response.raise_for_status()  # Check for HTTP errors
+            content = self._send(parsed_query)
 
             # Try to decode as UTF-8; if it fails, return as binary data
             try:
                 # Decode as UTF-8 if the content is text
-                return response.content.decode('utf-8')
+                return content.decode('utf-8')
             except UnicodeDecodeError:
                 # Return as binary if the content is not text (e.g., images)
-                return response.content
+                return content
 
-        except HTTPError as e:
+        except requests.HTTPError as e:
+            if raise_errors:
+                raise
             return f"HTTP error occurred - {e}"
         except Exception as e:
+            if raise_errors:
+                raise
             return f"Unexpected error - {e}"
 
+    def execute_array(self, query: Query, dimensions: int = None, encoding: str = None):
+        """
+        Sends a query and returns its result as a numpy array.
+
+        Unless an encoding is given, the most compact one for the result is chosen
+        (see Query.Types.most_compact), so numeric data is sent in a binary format
+        instead of CSV. The query itself is not changed.
+
+        Parameters:
+            query (Query) -> The query to send.
+
+            dimensions (int) = None -> Number of axes of the result. If it is None, it is the
+            number of trimmed axes in the subset of the query, so every axis of the coverage
+            should be in the subset.
+
+            encoding (str) = None -> One of Query.Types to use instead of the most compact one.
+
+        Return:
+            data (numpy.ndarray) -> The result. Aggregations return an array with a single value.
+        """
+        import copy
+        from wdc.Decoder import Decoder
+
+        if query.aggregate != None:
+            # Aggregations return a single number, which is never encoded
+            encoding = None
+        elif encoding == None:
+            if dimensions == None:
+                dimensions = len([ax for ax in query.subset or [] if ax.stop != None])
+            encoding = Query.Types.most_compact(dimensions)
+
+        encoded_query = copy.deepcopy(query)
+        encoded_query.encode(encoding)
+
+        return Decoder.decode(self._send(encoded_query.get_wcps()), encoding)
+
+    def _send(self, parsed_query: str):
+        """
+        Posts a WCPS query to the server and returns the body of the response.
+        The query is recorded if there is a recorder.
+
+        Raises requests.HTTPError if the server answers with an error.
+        """
+        import requests
+
+        headers = {"Accept-Encoding": "gzip, deflate" if self.compression else "identity"}
+
+        sent_at = time.time()
+        start = time.perf_counter()
+
+        try:
+            response = requests.post(self.server_url, data={  'query': parsed_query}, headers=headers)
+        except Exception:
+            if self.recorder != None:
+                self.recorder.record(parsed_query, sent_at, time.perf_counter() - start, 0, 0)
+            raise
+
+        if self.recorder != None:
+            self.recorder.record(parsed_query, sent_at, time.perf_counter() - start,
+                                 len(response.content), response.status_code)
+
+        response.raise_for_status()  # Check for HTTP errors
+        return response.content
+
+    def execute_queries(self, queries: List[Query | str], max_workers: int = 8,
+                        decode: bool = False, processes: int = None):
+        """
+        Sends many queries to the server at the same time.
+
+        If decode is True, binary results (e.g. png or tiff images) are decoded into
+        numpy arrays in a pool of processes, so decoding is not limited by the GIL.
+        Text results are returned unchanged.
+
+        Parameters:
+            queries (List[Query | str]) -> The queries to send.
+
+            max_workers (int) = 8 -> Number of requests that are sent at the same time.
+
+            decode (bool) = False -> Whether binary results are decoded into arrays.
+
+            processes (int) = None -> Number of decoding processes. If it is None, one
+            process is started for every CPU core.
+
+        Return:
+            results (List) -> The results, in the same order as the queries.
+        """
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(self.execute_query, queries))
+
+        if decode:
+            from wdc.Decoder import Decoder
+
+            binary = [i for i, result in enumerate(results) if isinstance(result, bytes)]
+            arrays = Decoder.decode_many([results[i] for i in binary], processes)
+
+            for i, array in zip(binary, arrays):
+                results[i] = array
+
+        return results
+
+    def get_grid(self, coverage_id: str):
+        """
+        Reads the grid of a coverage from its WCS DescribeCoverage document.
+
+        Parameters:
+            coverage_id (str) -> The identifier for the coverage.
+
+        Return:
+            grid (dict) -> For every axis label, (origin, resolution), where origin is the
+            coordinate of the centre of the first cell and resolution is the distance to the
+            next cell, negative if the coordinates decrease along the axis (e.g. Lat rows
+            that go from north to south).
+        """
+        import requests
+        import xml.etree.ElementTree as ElementTree
+
+        response = requests.get(self.server_url.split("?")[0],
+                                params={"SERVICE": "WCS", "VERSION": "2.0.1",
+                                        "REQUEST": "DescribeCoverage", "COVERAGEID": coverage_id})
+        response.raise_for_status()
+
+        document = ElementTree.fromstring(response.content)
+
+        def local_name(element):
+            return element.tag.rsplit("}", 1)[-1]
+
+        # Labels of the CRS axes, in the order of the coordinates of origin and offset vectors
+        labels = None
+        origin = None
+        offset_vectors = []
+        for element in document.iter():
+            name = local_name(element)
+            if name == "Envelope" and labels == None:
+                labels = element.get("axisLabels").split()
+            elif name == "origin" and origin == None:
+                position = next(e for e in element.iter() if local_name(e) == "pos")
+                origin = position.text.split()
+            elif name == "offsetVector":
+                offset_vectors.append(element.text.split())
+
+        grid = {}
+        for vector in offset_vectors:
+            for i, component in enumerate(vector):
+                # Every offset vector only moves along one axis
+                try:
+                    if float(component) != 0:
+                        grid[labels[i]] = (float(origin[i]), float(component))
+                except ValueError:
+                    # Time coordinates such as "2000-01-01T00:00:00Z" are not numbers
+                    pass
+
+        return grid
+
     def get_server_capabilities(self):
         """
         Retrieves the capabilities of the server.
@@ -57,11 +233,13 @@ class dbc:
         Returns:
             str: The server capabilities information.
         """
+        import requests
+
         try:
             response = requests.get(f"{self.server_url}/capabilities")
             response.raise_for_status()  # Check for HTTP errors
             return response.content.decode('utf-8')
-        except HTTPError as e:
+        except requests.HTTPError as e:
             return f"HTTP error occurred - {e}"
         except Exception as e:
             return f"Unexpected error - {e}"
@@ -76,12 +254,14 @@ class dbc:
         Returns:
             str: Metadata information about the specified coverage.
         """
+        import requests
+
         try:
             response = requests.get(
                 f"{self.server_url}/coverages/{coverage_id}/metadata")
             response.raise_for_status()  # Check for HTTP errors
             return response.content.decode('utf-8')
-        except HTTPError as e:
+        except requests.HTTPError as e:
             return f"HTTP error occurred - {e}"
         except Exception as e:
             return f"Unexpected error - {e}"
@@ -1,5 +1,16 @@
+from typing import List, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from itertools import product
+import copy
+import json
+import math
+
 from wdc.dbc import dbc
 from wdc.Query import Query
+from wdc.AxisSubset import AxisSubset
+from wdc.ResultCache import ResultCache
+from wdc.Prefetcher import Prefetcher
+from wdc.IncrementalStore import IncrementalStore
 
 class dco:
     """
@@ -10,22 +21,460 @@ class dco:
     Object Parameters:
         connector (dbc) -> A dbc object that handles connections to data.
         query (Query) -> A Query object that handles query generation.
+        cache (ResultCache) = None -> Cache for results that are reused, such as the coarse
+        previews of execute_progressive. A new cache is created if it is None.
+        prefetcher (Prefetcher) = None -> Guesses and sends the next queries in advance,
+        see enable_prefetching.
     """
 
-    def __init__(self, connector: dbc, query: Query):
+    def __init__(self, connector: dbc, query: Query, cache: ResultCache = None):
         self.connector = connector
         self.query = query
-    
+        self.cache = cache if cache != None else ResultCache()
+        self.prefetcher = None
+
     def execute_query(self):
         """
         Executes the query via the dbc inside the dco object.
 
+        If prefetching is enabled, the result might come from the cache.
+
         Return:
             data (str | bytes) -> The data that server sends. Might contain an error message.
         """
-        data = dbc.execute_query(self.query)
+        if self.prefetcher != None:
+            return self.prefetcher.execute_query(self.query)
+
+        data = self.connector.execute_query(self.query)
         return data
 
+    def enable_prefetching(self, budget: int = 4, max_workers: int = 2):
+        """
+        Makes execute_query guess the next queries (shifted subsets, next or previous
+        time step, neighbouring areas) and send them in the background, so that they are
+        already in the cache when they are executed.
+
+        Parameters:
+            budget (int) = 4 -> The largest number of prefetch requests that can run at the same time.
+
+            max_workers (int) = 2 -> Number of threads that send prefetch requests.
+
+        Return:
+            prefetcher (Prefetcher) -> The prefetcher, its statistics() show how many
+            queries were answered by a prefetch.
+        """
+        self.disable_prefetching()
+        self.prefetcher = Prefetcher(self.connector, self.cache, budget, max_workers)
+        return self.prefetcher
+
+    def disable_prefetching(self):
+        """
+        Stops prefetching. Results that were already prefetched stay in the cache.
+        """
+        if self.prefetcher != None:
+            self.prefetcher.shutdown()
+            self.prefetcher = None
+
+    def execute_progressive(self, scales: Tuple[float, ...] = (0.125,), tiles: int = 1):
+        """
+        Executes the query in several steps, from a coarse preview to full resolution.
+
+        First, the query is sent once for every scale factor (server-side scale()), from the
+        smallest to the largest, so something can be shown right away. Then the query is sent in
+        full resolution, split into tiles x tiles parts along the first two trimmed numeric
+        axes of the subset (e.g. Lat and Long).
+
+        Coarse results are kept in the cache of the dco object, so going back to
+        a preview (e.g. when zooming out) does not send a request. Previews that failed
+        are not cached, and their error message is returned as data.
+
+        Parameters:
+            scales (Tuple[float, ...]) = (0.125,) -> Scale factors of the previews.
+
+            tiles (int) = 1 -> Number of parts each of the two axes is split into at
+            full resolution.
+
+        Return:
+            A generator of (scale, subset, data) tuples, where scale is the scale factor
+            (1 for full resolution), subset is the list of AxisSubsets of the result and
+            data is what the server sends.
+        """
+
+        for scale in sorted(scales):
+            if scale >= 1:
+                continue
+
+            preview = copy.deepcopy(self.query)
+            preview.set_scale(scale)
+            wcps = preview.get_wcps()
+
+            data = self.cache.get(wcps)
+            if data == None:
+                try:
+                    data = self.connector.execute_query(wcps, raise_errors=True)
+                    self.cache.put(wcps, data)
+                except Exception as e:
+                    # Not cached, so the next zoom-out asks the server again
+                    data = f"Unexpected error - {e}"
+
+            yield scale, self.query.subset, data
+
+        for subset in dco._split_subset(self.query.subset, tiles):
+            tile = copy.deepcopy(self.query)
+            tile.reset_scale()
+            tile.set_subset(subset)
+
+            yield 1, subset, self.connector.execute_query(tile)
+
+    @staticmethod
+    def _split_subset(subset: List[AxisSubset], tiles: int):
+        """
+        Splits the first two trimmed numeric axes of a subset into tiles parts each.
+
+        Return:
+            subsets (List[List[AxisSubset]]) -> One subset for every tile.
+        """
+
+        if subset == None or tiles <= 1:
+            return [subset]
+
+        split_axes = [i for i, ax in enumerate(subset)
+                      if ax.stop != None and not isinstance(ax.start, str)][:2]
+
+        parts = []
+        for i in split_axes:
+            ax = subset[i]
+            step = (ax.stop - ax.start) / tiles
+            parts.append([AxisSubset(ax.axis, ax.start + step * k, ax.start + step * (k + 1))
+                          for k in range(tiles)])
+
+        subsets = []
+        for combination in product(*parts):
+            tile_subset = list(subset)
+            for i, ax in zip(split_axes, combination):
+                tile_subset[i] = ax
+            subsets.append(tile_subset)
+
+        return subsets
+
+    def extract_points(self, lats: List[float], longs: List[float], ansi_start, ansi_stop,
+                       box_size: float = 2.0, max_workers: int = 8,
+                       axis_order: Tuple[str, str, str] = ("ansi", "Lat", "Long"),
+                       grid: dict = None):
+        """
+        Extracts the time series of many Lat/Long points at once.
+
+        Instead of sending one request per point, nearby points are grouped into
+        bounding boxes of at most box_size degrees on each side. Every box is fetched
+        once as JSON (concurrently), and the series of each point is picked out of
+        the box it belongs to.
+
+        Points are matched to cells with the grid of the coverage (the centre of its first
+        cell and the signed size of a cell along Lat and Long), so the result does not
+        depend on how the server rounds the box or on the direction of the axes.
+
+        The coverages and the return value of the query inside the dco object are used,
+        its subset and encoding are replaced by the ones of each box.
+
+        Parameters:
+            lats (List[float]) -> Latitudes of the points.
+
+            longs (List[float]) -> Longitudes of the points, in the same order as lats.
+
+            ansi_start -> Start of the ansi range, e.g. "2003-09".
+
+            ansi_stop -> End of the ansi range, e.g. "2009-02".
+
+            box_size (float) = 2.0 -> Largest extent (in degrees) of a single request along
+            Lat and Long. Larger boxes mean less requests but more unused data.
+
+            max_workers (int) = 8 -> Number of requests that are sent at the same time.
+
+            axis_order (Tuple[str, str, str]) = ("ansi", "Lat", "Long") -> Order of the axes
+            in the data that the server returns for the coverage.
+
+            grid (dict) = None -> {"Lat": (origin, resolution), "Long": (origin, resolution)},
+            where origin is the centre of the first cell and resolution is negative if the
+            coordinates decrease along the axis. If it is None, it is read with dbc.get_grid.
+
+        Return:
+            data (numpy.ndarray) -> Array of shape (number of points, number of time steps),
+            rows are in the same order as the given points.
+        """
+        import numpy as np
+
+        if len(lats) != len(longs):
+            raise ValueError("lats and longs must have the same length")
+
+        if grid == None:
+            grid = self.connector.get_grid(self.query.coverages[0])
+
+        lat_cells = [dco._grid_index(lat, *grid["Lat"]) for lat in lats]
+        long_cells = [dco._grid_index(long, *grid["Long"]) for long in longs]
+
+        boxes = dco._plan_boxes(lats, longs, box_size)
+
+        def fetch(box):
+            lat_first, lat_last = min(lat_cells[i] for i in box), max(lat_cells[i] for i in box)
+            long_first, long_last = min(long_cells[i] for i in box), max(long_cells[i] for i in box)
+
+            # The box is trimmed between cell centres, so the server returns exactly the
+            # cells from the first to the last one, in grid order. Trims (even when both
+            # ends are equal) keep every axis, so the array has the three axes in axis_order.
+            lat_bounds = sorted(dco._cell_centre(cell, *grid["Lat"]) for cell in (lat_first, lat_last))
+            long_bounds = sorted(dco._cell_centre(cell, *grid["Long"]) for cell in (long_first, long_last))
+            box_query = Query(self.query.coverages, return_value=self.query.return_value,
+                              subset=[AxisSubset("ansi", ansi_start, ansi_stop),
+                                      AxisSubset("Lat", *lat_bounds),
+                                      AxisSubset("Long", *long_bounds)],
+                              return_type=Query.Types.json)
+
+            data = self.connector.execute_query(box_query)
+            try:
+                values = np.asarray(json.loads(data), dtype=float)
+            except (TypeError, ValueError):
+                raise dco.QueryFailedError(f"Unexpected response for {box_query}: {data}")
+
+            if values.ndim != 3:
+                raise dco.QueryFailedError(
+                    f"Expected a 3-dimensional result, got shape {values.shape}")
+
+            # Reorder to (ansi, Lat, Long)
+            values = values.transpose([axis_order.index(ax) for ax in ("ansi", "Lat", "Long")])
+
+            if values.shape[1:] != (lat_last - lat_first + 1, long_last - long_first + 1):
+                raise dco.QueryFailedError(
+                    f"Expected {lat_last - lat_first + 1} x {long_last - long_first + 1} cells "
+                    f"for {box_query}, got shape {values.shape[1:]}")
+
+            series = {}
+            for i in box:
+                series[i] = values[:, lat_cells[i] - lat_first, long_cells[i] - long_first]
+            return series
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(fetch, boxes))
+
+        if len(results) == 0:
+            return np.empty((0, 0))
+
+        time_steps = len(next(iter(results[0].values())))
+        data = np.empty((len(lats), time_steps))
+        for series in results:
+            for i, values in series.items():
+                data[i] = values
+
+        return data
+
+    def execute_incremental(self, store: IncrementalStore, refetch: int = 0):
+        """
+        Executes a query over an ansi range, fetching only the months that were not
+        fetched by an earlier call with the same query shape.
+
+        The query must have an ansi trim such as AxisSubset("ansi", "2003-09", "2009-02").
+        The store remembers which months were fetched for the query without its ansi subset.
+        When the range grows (e.g. one more month every night), only the new months are
+        sent and merged with the stored result. If the start of the range changes, the
+        whole range is fetched again.
+
+        Without an aggregation method, the result is the time series (ansi must be the first
+        axis of the coverage). With min, max, sum, count or avg, the stored partial
+        aggregates are combined into the aggregate of the whole range.
+
+        Parameters:
+            store (IncrementalStore) -> Remembers what was fetched before.
+
+            refetch (int) = 0 -> Number of months at the end of the stored range that are
+            fetched again, for data that might have changed since. Stored series are cut
+            before these months. For aggregates, the last refetch months of every range
+            are fetched and stored as a chunk of their own, so only they are sent again.
+
+        Return:
+            data (numpy.ndarray | float) -> The series or the aggregate of the whole ansi range.
+        """
+
+        ansi = [ax for ax in self.query.subset or [] if ax.axis == "ansi"]
+        if (len(ansi) != 1 or not isinstance(ansi[0].start, str) or not isinstance(ansi[0].stop, str)
+                or AxisSubset.month_index(ansi[0].start) == None
+                or AxisSubset.month_index(ansi[0].stop) == None):
+            raise ValueError("The query needs an ansi range such as AxisSubset(\"ansi\", \"2003-09\", \"2009-02\")")
+        ansi = ansi[0]
+
+        if self.query.aggregate not in (None, Query.AggregationMethod.min, Query.AggregationMethod.max,
+                                        Query.AggregationMethod.sum, Query.AggregationMethod.count,
+                                        Query.AggregationMethod.avg):
+            raise ValueError(f"Aggregation method {self.query.aggregate} cannot be combined")
+
+        # The query without its ansi range identifies what was fetched before
+        shape = copy.deepcopy(self.query)
+        shape.set_subset([ax for ax in self.query.subset if ax.axis != "ansi"])
+        key = shape.get_wcps()
+
+        start = AxisSubset.month_index(ansi.start)[0]
+        stop = AxisSubset.month_index(ansi.stop)[0]
+
+        chunks = store.get(key)
+        if len(chunks) > 0 and AxisSubset.month_index(chunks[0]["start"])[0] != start:
+            chunks = []
+
+        if len(chunks) > 0:
+            # Chunks are in order and follow each other, so this keeps the months
+            # from the start of the range up to the ones that need fetching.
+            cutoff = min(stop, AxisSubset.month_index(chunks[-1]["stop"])[0] - refetch)
+            chunks = [self._cut_chunk(chunk, cutoff) for chunk in chunks]
+            chunks = chunks[:chunks.index(None)] if None in chunks else chunks
+
+        next_month = AxisSubset.month_index(chunks[-1]["stop"])[0] + 1 if len(chunks) > 0 else start
+        if next_month <= stop:
+            ranges = [(next_month, stop)]
+            if self.query.aggregate != None and refetch > 0 and next_month <= stop - refetch:
+                ranges = [(next_month, stop - refetch), (stop - refetch + 1, stop)]
+
+            for first, last in ranges:
+                chunk_start = AxisSubset.shift_month(ansi.start, first - start)
+                chunk_stop = ansi.stop if last == stop else AxisSubset.shift_month(ansi.start, last - start)
+                chunks.append({"start": chunk_start, "stop": chunk_stop,
+                               "value": self._fetch_chunk(chunk_start, chunk_stop)})
+            store.put(key, chunks)
+
+        return self._combine_chunks(chunks)
+
+    def _cut_chunk(self, chunk, cutoff: int):
+        """
+        Returns the part of a stored chunk up to the month cutoff (see AxisSubset.month_index),
+        or None if nothing of it is kept. Aggregates cannot be cut, so a chunk that
+        goes past the cutoff is not kept at all.
+        """
+
+        chunk_start = AxisSubset.month_index(chunk["start"])[0]
+        chunk_stop = AxisSubset.month_index(chunk["stop"])[0]
+
+        if chunk_stop <= cutoff:
+            return chunk
+        if chunk_start > cutoff or self.query.aggregate != None:
+            return None
+
+        return {"start": chunk["start"], "stop": AxisSubset.shift_month(chunk["start"], cutoff - chunk_start),
+                "value": chunk["value"][:cutoff - chunk_start + 1]}
+
+    def _fetch_chunk(self, ansi_start: str, ansi_stop: str):
+        """
+        Executes the query for part of its ansi range.
+
+        Return:
+            value (List | float | dict) -> The series as a list, the aggregate, or for avg,
+            the sum and the number of cells.
+        """
+
+        chunk_query = copy.deepcopy(self.query)
+        chunk_query.set_subset([AxisSubset("ansi", ansi_start, ansi_stop) if ax.axis == "ansi" else ax
+                                for ax in self.query.subset])
+
+        if self.query.aggregate == None:
+            return self.connector.execute_array(chunk_query).tolist()
+
+        if self.query.aggregate == Query.AggregationMethod.avg:
+            # Averages can only be combined with the number of cells behind them
+            chunk_query.set_aggregation_method(Query.AggregationMethod.sum)
+            total = float(self.connector.execute_array(chunk_query)[0])
+
+            chunk_query.set_return_value(f"({self.query.return_value}) * 0 + 1")
+            cells = float(self.connector.execute_array(chunk_query)[0])
+
+            return {"sum": total, "cells": cells}
+
+        return float(self.connector.execute_array(chunk_query)[0])
+
+    def _combine_chunks(self, chunks):
+        """
+        Merges the values of the chunks into the result of the whole range.
+        """
+
+        values = [chunk["value"] for chunk in chunks]
+
+        if self.query.aggregate == None:
+            import numpy as np
+            return np.concatenate([np.asarray(value, dtype=float) for value in values])
+        if self.query.aggregate == Query.AggregationMethod.min:
+            return min(values)
+        if self.query.aggregate == Query.AggregationMethod.max:
+            return max(values)
+        if self.query.aggregate == Query.AggregationMethod.avg:
+            return sum(value["sum"] for value in values) / sum(value["cells"] for value in values)
+
+        # sum and count
+        return sum(values)
+
+    @staticmethod
+    def _plan_boxes(lats: List[float], longs: List[float], box_size: float):
+        """
+        Groups points into as few bounding boxes as it can (greedy first-fit),
+        where no box is larger than box_size along Lat or Long.
+
+        Return:
+            boxes (List[List[int]]) -> Indices of the points that belong to each box.
+        """
+
+        boxes = []
+        # Each bound is [lat_lo, lat_hi, long_lo, long_hi] of the box with the same index.
+        bounds = []
+        # Boxes that can still grow, by the box_size cell of the Long of their first point.
+        # A box only takes points within box_size of that Long, i.e. from the same or a
+        # neighbouring cell, so each point is only checked against a few boxes.
+        open_boxes = {}
+
+        # Sorting keeps the boxes compact, since neighbours are visited one after another.
+        for i in sorted(range(len(lats)), key=lambda i: (lats[i], longs[i])):
+            lat, long = lats[i], longs[i]
+            cell = math.floor(long / box_size)
+
+            candidates = []
+            for neighbour in (cell - 1, cell, cell + 1):
+                if neighbour in open_boxes:
+                    # Points come by increasing Lat, so a box that is too far south never grows again
+                    open_boxes[neighbour] = [b for b in open_boxes[neighbour] if lat - bounds[b][0] <= box_size]
+                    candidates.extend(open_boxes[neighbour])
+
+            # Oldest box first, as if every box was checked
+            for b in sorted(candidates):
+                bound = bounds[b]
+                lat_lo, lat_hi = min(bound[0], lat), max(bound[1], lat)
+                long_lo, long_hi = min(bound[2], long), max(bound[3], long)
+
+                if lat_hi - lat_lo <= box_size and long_hi - long_lo <= box_size:
+                    boxes[b].append(i)
+                    bound[:] = [lat_lo, lat_hi, long_lo, long_hi]
+                    break
+            else:
+                boxes.append([i])
+                bounds.append([lat, lat, long, long])
+                open_boxes.setdefault(cell, []).append(len(boxes) - 1)
+
+        return boxes
+
+    @staticmethod
+    def _grid_index(value: float, origin: float, resolution: float):
+        """
+        Returns the index of the grid cell that contains value, on an axis whose first
+        cell is centred on origin and whose cells are resolution apart.
+        """
+        return math.floor((value - origin) / resolution + 0.5)
+
+    @staticmethod
+    def _cell_centre(index: int, origin: float, resolution: float):
+        """
+        Returns the coordinate of the centre of a grid cell.
+        """
+        return origin + index * resolution
+
+    class QueryFailedError(Exception):
+        """
+        Raised when the server response cannot be used as the result of a query.
+
+        This usually means that the server returned an error message instead of data.
+        """
+        pass
+
     class Examples:
         """
         This class contains some functions that return some example queries,
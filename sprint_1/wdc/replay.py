@@ -0,0 +1,168 @@
+"""
+Replays a query log written by QueryRecorder against a server, to reproduce its load.
+
+Usage:
+    python -m wdc.replay LOG --url URL [--concurrency N] [--rate R] [--repeat K]
+    python -m wdc.replay LOG --local [--concurrency N] [--rate R] [--repeat K]
+
+With --local, the queries are sent to a stand-in server on this machine that answers
+every query with as many bytes as the recorded response had, which measures the
+client side alone. At the end, throughput and latency percentiles are printed.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List
+from urllib.parse import parse_qs
+import argparse
+import threading
+import time
+
+from wdc.QueryRecorder import QueryRecorder
+
+def replay(queries: List[str], url: str, concurrency: int = 8, rate: float = 0):
+    """
+    Sends the queries to the server and measures how long each one takes.
+
+    Parameters:
+        queries (List[str]) -> The WCPS queries to send, in order.
+
+        url (str) -> The URL of the server.
+
+        concurrency (int) = 8 -> Number of requests that are sent at the same time.
+
+        rate (float) = 0 -> Queries started per second. 0 sends them as fast as possible.
+
+    Return:
+        report (dict) -> requests, errors, seconds, bytes, throughput (requests per second)
+        and the p50, p90, p99 and max latencies in milliseconds.
+    """
+    import requests
+
+    local = threading.local()
+    start = time.perf_counter()
+
+    def send(indexed_query):
+        index, query = indexed_query
+
+        # Start the query at its place in the schedule
+        if rate > 0:
+            delay = start + index / rate - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+
+        sent = time.perf_counter()
+        try:
+            response = local.session.post(url, data={'query': query})
+            return time.perf_counter() - sent, len(response.content), response.ok
+        except requests.RequestException:
+            return time.perf_counter() - sent, 0, False
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(send, enumerate(queries)))
+
+    seconds = time.perf_counter() - start
+    latencies = sorted(latency for latency, size, ok in results)
+
+    report = {
+        "requests": len(results),
+        "errors": sum(1 for latency, size, ok in results if not ok),
+        "seconds": seconds,
+        "bytes": sum(size for latency, size, ok in results),
+        "throughput": len(results) / seconds if seconds > 0 else 0.0,
+    }
+    for name, fraction in [("p50", 0.5), ("p90", 0.9), ("p99", 0.99), ("max", 1.0)]:
+        report[name] = _percentile(latencies, fraction) * 1000
+
+    return report
+
+def start_stand_in(sizes: dict):
+    """
+    Starts a local server in a background thread that answers every query with
+    the number of bytes given for it in sizes (or an empty response).
+
+    Parameters:
+        sizes (dict) -> Response size in bytes for each WCPS query.
+
+    Return:
+        server (ThreadingHTTPServer) -> The running server, its URL is
+        http://127.0.0.1:<server.server_port>. Stop it with server.shutdown(),
+        then close its socket with server.server_close().
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            query = parse_qs(body.decode("utf-8")).get("query", [""])[0]
+            payload = b"0" * sizes.get(query, 0)
+
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def _percentile(values: List[float], fraction: float):
+    """
+    Returns the value at the given fraction of the sorted values (nearest rank).
+    """
+    if len(values) == 0:
+        return 0.0
+    return values[min(len(values) - 1, max(0, round(fraction * len(values)) - 1))]
+
+def main(argv: List[str] = None):
+    """
+    Command line entry point, see the description of the module.
+    """
+
+    parser = argparse.ArgumentParser(prog="python -m wdc.replay",
+                                     description="Replay a QueryRecorder log against a server.")
+    parser.add_argument("log", help="path of the log written by QueryRecorder")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--url", help="URL of the server to send the queries to")
+    target.add_argument("--local", action="store_true",
+                        help="send the queries to a stand-in server on this machine")
+    parser.add_argument("--concurrency", type=int, default=8,
+                        help="number of requests sent at the same time (default: 8)")
+    parser.add_argument("--rate", type=float, default=0,
+                        help="queries started per second, 0 for no limit (default: 0)")
+    parser.add_argument("--repeat", type=int, default=1,
+                        help="number of times the log is replayed (default: 1)")
+    args = parser.parse_args(argv)
+
+    records = list(QueryRecorder.read(args.log))
+    queries = [record["q"] for record in records] * args.repeat
+
+    server = None
+    url = args.url
+    if args.local:
+        server = start_stand_in({record["q"]: record["n"] for record in records})
+        url = f"http://127.0.0.1:{server.server_port}"
+
+    try:
+        report = replay(queries, url, args.concurrency, args.rate)
+    finally:
+        if server != None:
+            server.shutdown()
+            server.server_close()
+
+    print(f"requests:   {report['requests']} ({report['errors']} errors)")
+    print(f"duration:   {report['seconds']:.2f} s")
+    print(f"throughput: {report['throughput']:.1f} requests/s, "
+          f"{report['bytes'] / report['seconds'] / 1e6 if report['seconds'] > 0 else 0:.2f} MB/s")
+    print(f"latency:    p50 {report['p50']:.1f} ms, p90 {report['p90']:.1f} ms, "
+          f"p99 {report['p99']:.1f} ms, max {report['max']:.1f} ms")
+
+    return report
+
+if __name__ == "__main__":
+    main()